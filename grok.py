@@ -4,7 +4,8 @@ Grok API client script for processing text and images.
 
 This script provides a command-line interface to interact with the Grok API,
 supporting text prompts and analysis of various file types including PDFs,
-images, and documents.
+images, and documents. It can also be imported and used via call_grok_api(),
+which raises GrokError subclasses instead of exiting.
 
 Requirements:
 - GROK_API_KEY environment variable or ~/.env file
@@ -15,14 +16,50 @@ Requirements:
 import os
 import sys
 import argparse
+import atexit
+import http.client
 import urllib.request
 import urllib.parse
 import json
+import logging
 import base64
+import hashlib
+import math
 import mimetypes
+import mmap
+import re
+import secrets
+import select
 import subprocess
+import shutil
 import tempfile
-from typing import Optional, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, Set, Tuple
+
+try:
+    from pybase64 import b64encode_as_string  # type: ignore
+except ImportError:
+    # Fallback to the standard library codec if pybase64 not available
+    def b64encode_as_string(data):
+        return base64.b64encode(data).decode('ascii')
+
+try:
+    import blake3  # type: ignore
+except ImportError:
+    # Fallback to hashlib's BLAKE2b if blake3 not available
+    blake3 = None
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    # Fallback to the standard json module if orjson not available
+    orjson = None
+
+# Progress and diagnostics go through logging so importers (e.g. the invoice renamer)
+# decide where they end up; main() prints them to stderr for command-line use
+logger = logging.getLogger(__name__)
 
 
 class GrokError(Exception):
@@ -44,159 +81,243 @@ class APIError(GrokError):
 MAX_RAW_SIZE = 7_500_000  # ~7.5MB raw = ~10MB base64
 MAX_BASE64_SIZE = 10_000_000  # 10MB base64 limit
 DEFAULT_PDF_DPI = 100
+PDF_JPEG_QUALITY = 80  # Plenty for vision models reading text
+PDF_FALLBACK_DPI = 75
+PDF_FALLBACK_JPEG_QUALITY = 60
 PDF_EXTRACTION_TIMEOUT = 15
 CONVERSION_TIMEOUT = 60
 COMPRESSION_TIMEOUT = 30
+JPEG_MAX_QUALITY = 85
+JPEG_MIN_QUALITY = 20
+MIN_SCALE_PERCENT = 10
+MAX_COMPRESSION_ATTEMPTS = 4
+MAX_PAGE_WORKERS = 8
+PAGE_POLL_INTERVAL = 0.05  # Seconds between checks for newly rendered PDF pages
+JPEG_ASSUMED_SOURCE_QUALITY = 90  # Typical quality of camera/scanner JPEGs
+LOSSLESS_TO_JPEG_RATIO = 0.5  # JPEG at quality 100 vs. a lossless original
 MIN_MEANINGFUL_TEXT = 10
 ENV_FILE_PATH = "~/.env"
+CACHE_DIR = "~/.cache/grok-renamer"
 DEFAULT_MODEL = "grok-4-fast-reasoning"
 VISION_MODEL = "grok-2-vision-1212"
 API_URL = "https://api.x.ai/v1/chat/completions"
+API_TIMEOUT = 300  # Seconds to wait on the API connection
+BODY_CHUNK_SIZE = 1 << 20  # Bytes of each image data URL encoded per write while sending
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
+# Matches "KEY=value" or "export KEY=value" lines in ~/.env (comments never match)
+ENV_LINE_PATTERN = re.compile(r'^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=(.*)$', re.MULTILINE)
+
+# Keep-alive connections to the API host, one per thread so concurrent callers
+# never interleave requests on the same socket
+_api_local = threading.local()
+_api_connections: Set[http.client.HTTPSConnection] = set()
+_api_connections_lock = threading.Lock()
+
+# Content digests already computed in this process (see file_content_digest)
+_digests: Dict[Tuple[int, int, int, int], str] = {}
+_digest_lock = threading.Lock()
+
+# Set once ~/.env has been fully applied to os.environ
+_env_loaded = False
+
 # Supported file extensions
-IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif']
-COMPRESSED_FORMATS = ['.png', '.bmp', '.tiff', '.tif', '.pbm', '.ppm', '.pgm']
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif'})
+JPEG_EXTENSIONS = frozenset({'.jpg', '.jpeg'})
+PNM_FORMATS = frozenset({'pbm', 'ppm', 'pgm'})  # Written by pdfimages, not accepted by the API
+
+# Page files written by pdftoppm into the conversion scratch directory
+RENDERED_PAGE_PATTERN = re.compile(r'^page-(\d+)\.jpg$')
+
+# "data:<type>;base64," headers, built once per MIME type
+_DATA_URL_PREFIXES: Dict[str, str] = {}
+
+# Resolved paths of Poppler tools, looked up once per process
+_POPPLER_BINS: Dict[str, Optional[str]] = {}
+
+
+def find_poppler_binary(name: str) -> Optional[str]:
+    """Locate a Poppler tool (pdftotext, pdftoppm, pdfimages), caching the result
+
+    Args:
+        name: Name of the Poppler executable
+
+    Returns:
+        Full path to the executable, or None if it could not be found
+    """
+    if name not in _POPPLER_BINS:
+        # Try common locations first, then fall back to PATH
+        candidates = [f'/opt/homebrew/bin/{name}', f'/usr/bin/{name}', f'/usr/local/bin/{name}']
+        _POPPLER_BINS[name] = next((path for path in candidates if os.path.exists(path)), None) or shutil.which(name)
+    return _POPPLER_BINS[name]
+
+
+def build_image_content(image_data, mime_type: str) -> Dict[str, Any]:
+    """Base64-encode image bytes into an image_url content entry for the Grok API
+
+    Args:
+        image_data: Raw image bytes (any bytes-like object)
+        mime_type: MIME type for the data URL
+
+    Returns:
+        Image content dict for the Grok API
+    """
+    # Build the data URL in one step from the encoded text; the per-type header is cached
+    base64_data = b64encode_as_string(image_data)
+
+    # Double check base64 size
+    if len(base64_data) > MAX_BASE64_SIZE:
+        raise FileProcessingError(f"Base64 image size ({len(base64_data):,} bytes) exceeds {MAX_BASE64_SIZE:,} bytes limit")
+
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": ''.join((data_url_prefix(mime_type), base64_data)),
+            "detail": "high"
+        }
+    }
+
+
+def build_image_content_from_file(file_path: str, mime_type: str) -> Dict[str, Any]:
+    """Base64-encode an image file into an image_url content entry for the Grok API
+
+    The file is memory-mapped and handed straight to the encoder, so its contents are
+    paged in by the OS instead of being copied into a Python bytes object first.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return build_image_content(b'', mime_type)  # Empty files can't be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            return build_image_content(mapped, mime_type)
 
 
-def process_image_file(file_path: str, mime_type: Optional[str] = None) -> Dict[str, Any]:
-    """Process image file and return appropriate format for Grok API with size optimization"""
+def data_url_prefix(mime_type: str) -> str:
+    """Return the cached "data:<type>;base64," header for a MIME type"""
+    prefix = _DATA_URL_PREFIXES.get(mime_type)
+    if prefix is None:
+        prefix = _DATA_URL_PREFIXES[mime_type] = f"data:{mime_type};base64,"
+    return prefix
+
+
+def process_image_file(file_path: str, mime_type: Optional[str] = None, file_size: Optional[int] = None) -> Dict[str, Any]:
+    """Process image file and return appropriate format for Grok API with size optimization
+
+    Args:
+        file_path: Path to the image file
+        mime_type: MIME type for the data URL (defaults to image/jpeg)
+        file_size: Size of the file if already known (e.g. from os.scandir), saves a stat call
+    """
     try:
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
+        # Check the size on disk first so oversized images go straight to compression
+        # without reading the original into memory
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
 
-        if len(file_data) > MAX_RAW_SIZE:
-            print(f"Image too large ({len(file_data):,} bytes), compressing...", file=sys.stderr)
+        if file_size > MAX_RAW_SIZE:
+            logger.info(f"Image too large ({file_size:,} bytes), compressing...")
 
             # Try to compress the image using various methods
-            compressed_data = compress_image(file_path, file_data, MAX_RAW_SIZE)
+            compressed_data = compress_image(file_path, file_size, MAX_RAW_SIZE)
             if compressed_data:
-                file_data = compressed_data
+                return build_image_content(compressed_data, 'image/jpeg')  # compress_image always produces JPEG
             else:
                 # Final hard check - fail if still too large
-                print(f"Error: Image still too large after compression ({len(file_data):,} bytes raw, would be {int(len(file_data) * 1.33):,} bytes base64)", file=sys.stderr)
-                print(f"Maximum allowed: {MAX_RAW_SIZE:,} bytes raw ({MAX_BASE64_SIZE:,} bytes base64 limit)", file=sys.stderr)
-                sys.exit(1)
-
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-
-        # Double check base64 size
-        if len(base64_data) > MAX_BASE64_SIZE:
-            print(f"Error: Base64 image size ({len(base64_data):,} bytes) exceeds {MAX_BASE64_SIZE:,} bytes limit", file=sys.stderr)
-            sys.exit(1)
-
-        return {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:{mime_type or 'image/jpeg'};base64,{base64_data}",
-                "detail": "high"
-            }
-        }
+                raise FileProcessingError(
+                    f"Image still too large after compression ({file_size:,} bytes raw, would be {int(file_size * 1.33):,} bytes base64). "
+                    f"Maximum allowed: {MAX_RAW_SIZE:,} bytes raw ({MAX_BASE64_SIZE:,} bytes base64 limit)")
+
+        return build_image_content_from_file(file_path, mime_type or 'image/jpeg')
+    except GrokError:
+        raise
     except Exception as e:
-        print(f"Error processing image file '{file_path}': {e}", file=sys.stderr)
-        sys.exit(1)
+        raise FileProcessingError(f"Could not process image file '{file_path}': {e}") from e
+
+
+def estimate_jpeg_size(original_size: int, quality: int, is_jpeg_source: bool) -> int:
+    """Roughly predict the size of a JPEG re-encode of an image
+
+    JPEG output grows about linearly with the quality setting, so the prediction is a
+    ratio of the original size.
+
+    Args:
+        original_size: Size of the original image file in bytes
+        quality: Target JPEG quality (1-100)
+        is_jpeg_source: Whether the original is already a JPEG
 
+    Returns:
+        Predicted size of the re-encoded image in bytes
+    """
+    if is_jpeg_source:
+        factor = quality / JPEG_ASSUMED_SOURCE_QUALITY
+    else:
+        factor = quality / 100 * LOSSLESS_TO_JPEG_RATIO
+    return int(original_size * factor)
 
-def compress_image(file_path: str, original_data: bytes, max_size: int) -> Optional[bytes]:
-    """Try various image compression methods to reduce file size
+
+def compress_image(file_path: str, original_size: int, max_size: int) -> Optional[bytes]:
+    """Compress an image to JPEG so it fits within the size limit
+
+    The starting quality and scale are picked from estimate_jpeg_size, and
+    each ImageMagick pass applies quality, chroma subsampling, metadata stripping and
+    (if needed) resizing together, so most images fit after one or two passes.
 
     Args:
         file_path: Path to the image file
-        original_data: Original image data as bytes
+        original_size: Size of the original image file in bytes
         max_size: Maximum allowed size in bytes
 
     Returns:
         Compressed image data as bytes, or None if compression failed
     """
-    file_ext = os.path.splitext(file_path)[1].lower()
+    is_jpeg_source = os.path.splitext(file_path)[1].lower() in JPEG_EXTENSIONS
 
-    try:
-        # Method 1: Try converting to JPEG with quality reduction (if not already JPEG)
-        if file_ext in COMPRESSED_FORMATS:
-            for quality in [85, 70, 50, 30]:
-                try:
-                    # Use ImageMagick convert if available
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                        temp_path = tmp_file.name
-
-                    result = subprocess.run(['convert', file_path, '-quality', str(quality), temp_path],
-                                            capture_output=True, text=True, timeout=COMPRESSION_TIMEOUT)
-
-                    if result.returncode == 0 and os.path.exists(temp_path):
-                        with open(temp_path, 'rb') as f:
-                            compressed_data = f.read()
-                        os.unlink(temp_path)
-
-                        if len(compressed_data) <= max_size:
-                            print(f"Compressed to JPEG quality {quality}: {len(compressed_data):,} bytes", file=sys.stderr)
-                            return compressed_data
-                    else:
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
-
-                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
-                    continue
-
-        # Method 2: For JPEG files, try re-compressing with lower quality
-        elif file_ext in ['.jpg', '.jpeg']:
-            for quality in [70, 50, 30, 20]:
-                try:
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                        temp_path = tmp_file.name
-
-                    result = subprocess.run(['convert', file_path, '-quality', str(quality), temp_path],
-                                            capture_output=True, text=True, timeout=COMPRESSION_TIMEOUT)
-
-                    if result.returncode == 0 and os.path.exists(temp_path):
-                        with open(temp_path, 'rb') as f:
-                            compressed_data = f.read()
-                        os.unlink(temp_path)
-
-                        if len(compressed_data) <= max_size:
-                            print(f"Recompressed JPEG to quality {quality}: {len(compressed_data):,} bytes", file=sys.stderr)
-                            return compressed_data
-                    else:
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
+    # Skip qualities that are predicted not to fit, and resize right away if even the lowest won't
+    quality = JPEG_MAX_QUALITY
+    while quality > JPEG_MIN_QUALITY and estimate_jpeg_size(original_size, quality, is_jpeg_source) > max_size:
+        quality -= 5
+    scale = 100
+    predicted_size = estimate_jpeg_size(original_size, quality, is_jpeg_source)
+    if predicted_size > max_size:
+        scale = max(MIN_SCALE_PERCENT, int(100 * math.sqrt(max_size / predicted_size)))
 
-                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
-                    continue
+    try:
+        for _ in range(MAX_COMPRESSION_ATTEMPTS):
+            convert_args = ['convert', file_path, '-sampling-factor', '4:2:0', '-strip', '-quality', str(quality)]
+            if scale < 100:
+                convert_args.extend(['-resize', f'{scale}%'])
 
-        # Method 3: Try scaling down the image
-        for scale in ['75%', '50%', '25%']:
             try:
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                    temp_path = tmp_file.name
-
-                result = subprocess.run(['convert', file_path, '-resize', scale, '-quality', '70', temp_path],
-                                        capture_output=True, text=True, timeout=COMPRESSION_TIMEOUT)
+                # Write the JPEG to stdout so the result never touches the disk
+                result = subprocess.run(convert_args + ['jpg:-'], capture_output=True, timeout=COMPRESSION_TIMEOUT)
+            except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+                logger.warning(f"Image conversion failed: {e}")
+                break
 
-                if result.returncode == 0 and os.path.exists(temp_path):
-                    with open(temp_path, 'rb') as f:
-                        compressed_data = f.read()
-                    os.unlink(temp_path)
+            if result.returncode != 0 or not result.stdout:
+                logger.warning(f"Image conversion failed: {result.stderr.decode(errors='replace').strip()}")
+                break
+            compressed_data = result.stdout
 
-                    if len(compressed_data) <= max_size:
-                        print(f"Scaled to {scale} and compressed: {len(compressed_data):,} bytes", file=sys.stderr)
-                        return compressed_data
+            if len(compressed_data) <= max_size:
+                if scale < 100:
+                    logger.info(f"Scaled to {scale}% and compressed to JPEG quality {quality}: {len(compressed_data):,} bytes")
                 else:
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
+                    logger.info(f"Compressed to JPEG quality {quality}: {len(compressed_data):,} bytes")
+                return compressed_data
 
-            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                continue
+            # Still too large - lower the quality first, then scale down by how far off we were
+            if quality > JPEG_MIN_QUALITY:
+                quality = max(JPEG_MIN_QUALITY, quality // 2)
+            else:
+                scale = max(MIN_SCALE_PERCENT, int(scale * math.sqrt(max_size / len(compressed_data)) * 0.9))
 
-        print("Warning: Could not compress image below size limit", file=sys.stderr)
+        logger.warning("Could not compress image below size limit")
         return None
 
     except Exception as e:
-        print(f"Error during image compression: {e}", file=sys.stderr)
+        logger.error(f"Image compression failed: {e}")
         return None
 
 
@@ -205,29 +326,17 @@ def extract_embedded_images(file_path, all_pages=False):
     import tempfile
 
     try:
-        # Try to find pdfimages in common locations
-        pdfimages_paths = ['/opt/homebrew/bin/pdfimages', '/usr/bin/pdfimages', '/usr/local/bin/pdfimages']
-        pdfimages_cmd = None
-        for path in pdfimages_paths:
-            if os.path.exists(path):
-                pdfimages_cmd = path
-                break
-
+        pdfimages_cmd = find_poppler_binary('pdfimages')
         if not pdfimages_cmd:
-            # Try to find it in PATH
-            try:
-                result = subprocess.run(['which', 'pdfimages'], capture_output=True, text=True, check=True)
-                pdfimages_cmd = result.stdout.strip()
-            except subprocess.CalledProcessError:
-                print("pdfimages not found, will use conversion fallback", file=sys.stderr)
-                return None
+            logger.info("pdfimages not found, will use conversion fallback")
+            return None
 
         # Create temporary directory for extracted images
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_prefix = os.path.join(temp_dir, 'extracted')
 
             # Extract images (with timeout)
-            print("Attempting to extract embedded images...", file=sys.stderr)
+            logger.info("Attempting to extract embedded images...")
             # Extract only first page by default
             pdfimages_args = [pdfimages_cmd, '-j', '-p']
             if not all_pages:
@@ -237,23 +346,24 @@ def extract_embedded_images(file_path, all_pages=False):
             result = subprocess.run(pdfimages_args, capture_output=True, text=True, timeout=15)
 
             if result.returncode == 0:
-                # Look for extracted images
-                import glob
-                extracted_files = glob.glob(temp_prefix + '*')
+                # Look for extracted images, keeping the sizes scandir already has
+                with os.scandir(temp_dir) as entries:
+                    extracted_files = [(entry.path, entry.stat().st_size)
+                                       for entry in entries if entry.name.startswith('extracted')]
 
                 if extracted_files:
                     # Sort to get files in page order
                     extracted_files.sort()
 
                     # Helper function to convert and process a single image file
-                    def process_extracted_image(img_file):
+                    def process_extracted_image(img_file, file_size):
                         _, ext = os.path.splitext(img_file)
                         ext_lower = ext[1:].lower() if ext else ""
 
                         # Convert unsupported formats (pbm, ppm, pgm) to PNG
-                        if ext_lower in ['pbm', 'ppm', 'pgm']:
+                        if ext_lower in PNM_FORMATS:
                             try:
-                                from PIL import Image, ImageOps
+                                from PIL import Image, ImageOps, ImageStat
                                 png_file = img_file + '.png'
                                 img = Image.open(img_file)
                                 # Convert 1-bit images to 8-bit grayscale for better compatibility
@@ -264,14 +374,15 @@ def extract_embedded_images(file_path, all_pages=False):
 
                                 # Check if image might be inverted (mostly black background)
                                 if img.mode == 'L':
-                                    pixels = list(img.getdata())
-                                    avg_brightness = sum(pixels) / len(pixels)
+                                    # Mean is computed in C over the decoded buffer
+                                    avg_brightness = ImageStat.Stat(img).mean[0]
                                     # If image is very dark (avg < 50), it might be inverted
                                     if avg_brightness < 50:
                                         img = ImageOps.invert(img)
 
                                 img.save(png_file, 'PNG', optimize=True)
                                 img_file = png_file
+                                file_size = None
                                 mime_type = "image/png"
                             except ImportError:
                                 # Fall back to ImageMagick convert
@@ -280,175 +391,166 @@ def extract_embedded_images(file_path, all_pages=False):
                                                capture_output=True, text=True, timeout=15, check=True)
                                 if os.path.exists(png_file):
                                     img_file = png_file
+                                    file_size = None
                                     mime_type = "image/png"
                             except Exception as e:
-                                print(f"Warning: Error converting {ext_lower.upper()}: {e}", file=sys.stderr)
+                                logger.warning(f"Could not convert {ext_lower.upper()}: {e}")
                                 mime_type = "image/png"  # Try PNG mime type anyway
                         else:
                             mime_type = f"image/{ext_lower}" if ext_lower else "image/jpeg"
 
-                        return process_image_file(img_file, mime_type)
+                        return process_image_file(img_file, mime_type, file_size=file_size)
 
                     if all_pages and len(extracted_files) > 1:
                         # Process multiple images
-                        print(f"Found {len(extracted_files)} embedded image(s), processing all pages", file=sys.stderr)
+                        logger.info(f"Found {len(extracted_files)} embedded image(s), processing all pages")
                         images = []
-                        for img_file in extracted_files:
-                            images.append(process_extracted_image(img_file))
+                        for img_file, file_size in extracted_files:
+                            images.append(process_extracted_image(img_file, file_size))
                         return {"type": "multi_image", "images": images}
                     else:
                         # Process only first image
-                        image_file = extracted_files[0]
-                        print(f"Found {len(extracted_files)} embedded image(s), using first page: {os.path.basename(image_file)}", file=sys.stderr)
-                        return process_extracted_image(image_file)
+                        image_file, file_size = extracted_files[0]
+                        logger.info(f"Found {len(extracted_files)} embedded image(s), using first page: {os.path.basename(image_file)}")
+                        return process_extracted_image(image_file, file_size)
                 else:
-                    print("No embedded images extracted", file=sys.stderr)
+                    logger.info("No embedded images extracted")
                     return None
             else:
-                print(f"pdfimages failed: {result.stderr}", file=sys.stderr)
+                logger.warning(f"pdfimages failed: {result.stderr}")
                 return None
 
     except subprocess.TimeoutExpired:
-        print("Image extraction timed out", file=sys.stderr)
+        logger.warning("Image extraction timed out")
         return None
+    except GrokError:
+        raise
     except Exception as e:
-        print(f"Error extracting embedded images: {e}", file=sys.stderr)
+        logger.error(f"Could not extract embedded images: {e}")
         return None
 
 
+def process_pdf_page(file_path, pdftoppm_cmd, image_path, page_num):
+    """Shrink (if needed) and base64-encode one page rendered by pdftoppm
+
+    Args:
+        file_path: Path to the source PDF (used to re-render the page if it is too large)
+        pdftoppm_cmd: Path to the pdftoppm executable
+        image_path: Path to the rendered JPEG for this page (in a scratch directory owned by the caller)
+        page_num: 1-based page number
+
+    Returns:
+        Image content dict for the Grok API
+    """
+    # Check the size of the generated image without reading it
+    page_size = os.path.getsize(image_path)
+
+    if page_size > MAX_RAW_SIZE:
+        logger.info(f"Image too large ({page_size:,} bytes), re-rendering page {page_num} at lower quality...")
+        # Re-render just this page once at reduced resolution and quality
+        fallback_prefix = image_path[:-4] + '_small'
+        try:
+            subprocess.run([pdftoppm_cmd, '-jpeg', '-jpegopt', f'quality={PDF_FALLBACK_JPEG_QUALITY},progressive=y',
+                            '-r', str(PDF_FALLBACK_DPI), '-f', str(page_num), '-l', str(page_num), '-singlefile',
+                            file_path, fallback_prefix],
+                           capture_output=True, text=True, check=True, timeout=COMPRESSION_TIMEOUT)
+            fallback_path = fallback_prefix + '.jpg'
+            page_size = os.path.getsize(fallback_path)
+            image_path = fallback_path
+            logger.info(f"Re-rendered page {page_num}: {page_size:,} bytes")
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            # If re-rendering fails, we still need to check if it's under the limit
+            logger.warning(f"Could not re-render page {page_num}: {e}")
+
+    # Final hard check - fail if still too large
+    if page_size > MAX_RAW_SIZE:
+        raise FileProcessingError(
+            f"Image still too large after compression ({page_size:,} bytes raw, would be {int(page_size * 1.33):,} bytes base64). "
+            f"Maximum allowed: {MAX_RAW_SIZE:,} bytes raw ({MAX_BASE64_SIZE:,} bytes base64 limit)")
+
+    # Encode straight from a memory map of the page
+    return build_image_content_from_file(image_path, 'image/jpeg')
+
+
+def list_rendered_pages(output_dir):
+    """List pages written by pdftoppm into output_dir as sorted (page_num, path) pairs
+
+    pdftoppm zero-pads page numbers to the width of the last page (page-01.jpg for a
+    10+ page document), so pages are matched by pattern rather than by exact name.
+    """
+    pages = []
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = RENDERED_PAGE_PATTERN.match(entry.name)
+            if match:
+                pages.append((int(match.group(1)), entry.path))
+    pages.sort()
+    return pages
+
+
 def convert_pdf_to_images(file_path, max_pages=5):
     """Convert multiple PDF pages to images and return combined content"""
 
     try:
-        # Create temporary file for the images
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            temp_image_path = tmp_file.name
-
-        # Convert multiple pages of PDF to PNG (limit to max_pages to avoid huge documents)
-        # Try to find pdftoppm in common locations
-        pdftoppm_paths = ['/opt/homebrew/bin/pdftoppm', '/usr/bin/pdftoppm', '/usr/local/bin/pdftoppm']
-        pdftoppm_cmd = None
-        for path in pdftoppm_paths:
-            if os.path.exists(path):
-                pdftoppm_cmd = path
-                break
-
+        # Convert multiple pages of PDF to JPEG (limit to max_pages to avoid huge documents)
+        pdftoppm_cmd = find_poppler_binary('pdftoppm')
         if not pdftoppm_cmd:
-            # Try to find it in PATH
-            try:
-                result = subprocess.run(['which', 'pdftoppm'], capture_output=True, text=True, check=True)
-                pdftoppm_cmd = result.stdout.strip()
-            except subprocess.CalledProcessError:
-                raise Exception("pdftoppm not found. Please install poppler-utils.")
-
-        # Use lower DPI (100 instead of default 300) to reduce processing time and file size
-        # Add short timeout to prevent hanging on problematic PDFs
-        pdftoppm_args = [pdftoppm_cmd, '-png', '-r', '100', '-f', '1']
-        if max_pages is not None:
-            pdftoppm_args.extend(['-l', str(max_pages)])
-            print(f"Converting PDF to PNG at 100 DPI (max {max_pages} pages)...", file=sys.stderr)
-        else:
-            print("Converting PDF to PNG at 100 DPI (all pages)...", file=sys.stderr)
-        pdftoppm_args.extend([file_path, temp_image_path[:-4]])
+            raise FileProcessingError("pdftoppm not found. Please install poppler-utils.")
 
-        result = subprocess.run(pdftoppm_args, capture_output=True, text=True, check=True, timeout=60)
-
-        # Collect all generated images
-        print("PDF conversion completed, collecting generated images...", file=sys.stderr)
-        image_content = []
-        page_num = 1
+        # All renders (including per-page fallbacks) go into one scratch directory that is
+        # removed in a single step when done, even if a page fails
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_prefix = os.path.join(temp_dir, 'page')
+
+            # Use lower DPI (100 instead of default 300) and render straight to JPEG to keep
+            # pages small; photographic/scanned content is far smaller than lossless PNG
+            # Add short timeout to prevent hanging on problematic PDFs
+            pdftoppm_args = [pdftoppm_cmd, '-jpeg', '-jpegopt', f'quality={PDF_JPEG_QUALITY},progressive=y',
+                             '-r', str(DEFAULT_PDF_DPI), '-f', '1']
+            if max_pages is not None:
+                pdftoppm_args.extend(['-l', str(max_pages)])
+                logger.info(f"Converting PDF to JPEG at {DEFAULT_PDF_DPI} DPI (max {max_pages} pages)...")
+            else:
+                logger.info(f"Converting PDF to JPEG at {DEFAULT_PDF_DPI} DPI (all pages)...")
+            pdftoppm_args.extend([file_path, output_prefix])
+
+            # Run pdftoppm in the background and start processing each page as soon as it
+            # has been fully written, overlapping base64 encoding with rasterization.
+            # Pages are written in order, so every page but the newest one is complete
+            # while pdftoppm is still running.
+            page_futures = {}
+            with open(os.path.join(temp_dir, 'pdftoppm.log'), 'w+') as error_log, \
+                    ThreadPoolExecutor(max_workers=min(MAX_PAGE_WORKERS, os.cpu_count() or 1)) as executor:
+                process = subprocess.Popen(pdftoppm_args, stdout=subprocess.DEVNULL, stderr=error_log)
+                deadline = time.monotonic() + CONVERSION_TIMEOUT
+
+                while True:
+                    finished = process.poll() is not None
+                    rendered_pages = list_rendered_pages(temp_dir)
+                    ready_pages = rendered_pages if finished else rendered_pages[:-1]
+                    for page_num, page_path in ready_pages:
+                        if page_num not in page_futures:
+                            logger.info(f"Page {page_num} rendered, processing...")
+                            page_futures[page_num] = executor.submit(process_pdf_page, file_path, pdftoppm_cmd, page_path, page_num)
+                    if finished:
+                        break
+                    if time.monotonic() > deadline:
+                        process.kill()
+                        process.wait()
+                        raise subprocess.TimeoutExpired(pdftoppm_args, CONVERSION_TIMEOUT)
+                    time.sleep(PAGE_POLL_INTERVAL)
 
-        while True:
-            actual_image_path = temp_image_path[:-4] + f'-{page_num}.png'
-            print(f"Looking for image: {actual_image_path}", file=sys.stderr)
-            if not os.path.exists(actual_image_path):
-                print(f"No more images found, stopping at page {page_num}", file=sys.stderr)
-                break
+                if process.returncode != 0:
+                    error_log.seek(0)
+                    raise subprocess.CalledProcessError(process.returncode, pdftoppm_args, stderr=error_log.read())
 
-            # Read the generated image and check size
-            with open(actual_image_path, 'rb') as f:
-                file_data = f.read()
-
-            # Hard limit: 10MB base64 = ~7.5MB raw file
-            max_raw_size = 7_500_000  # ~7.5MB raw = ~10MB base64
-
-            if len(file_data) > max_raw_size:
-                print(f"Image too large ({len(file_data):,} bytes), compressing...", file=sys.stderr)
-                # Try to compress using pngquant if available, otherwise reduce DPI further
-                try:
-                    # Create a compressed version
-                    compressed_path = actual_image_path.replace('.png', '_compressed.png')
-
-                    # Try pngquant first (best compression for text)
-                    pngquant_result = subprocess.run(['pngquant', '--force', '--output', compressed_path, actual_image_path],
-                                                     capture_output=True)
-
-                    if pngquant_result.returncode == 0 and os.path.exists(compressed_path):
-                        # Use compressed version if it's smaller
-                        with open(compressed_path, 'rb') as f:
-                            compressed_data = f.read()
-                        if len(compressed_data) < len(file_data):
-                            file_data = compressed_data
-                            print(f"Compressed to {len(file_data):,} bytes", file=sys.stderr)
-                        os.unlink(compressed_path)
-                    else:
-                        # Fallback: try progressively lower DPI until we get under the limit
-                        for dpi in [100, 75, 50]:
-                            print(f"Pngquant not available, trying DPI {dpi}...", file=sys.stderr)
-                            low_dpi_path = actual_image_path.replace('.png', f'_dpi{dpi}.png')
-                            try:
-                                subprocess.run([pdftoppm_cmd, '-png', '-r', str(dpi), '-f', str(page_num), '-l', str(page_num),
-                                               file_path, low_dpi_path[:-4]],
-                                               capture_output=True, text=True, check=True, timeout=30)
-
-                                low_dpi_actual = low_dpi_path[:-4] + f'-{page_num}.png'
-                                if os.path.exists(low_dpi_actual):
-                                    with open(low_dpi_actual, 'rb') as f:
-                                        test_data = f.read()
-                                    os.unlink(low_dpi_actual)
-                                    print(f"DPI {dpi} version: {len(test_data):,} bytes", file=sys.stderr)
-                                    if len(test_data) <= max_raw_size:
-                                        file_data = test_data
-                                        break
-                                    elif dpi == 50:
-                                        # This is our last attempt
-                                        file_data = test_data
-                            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-                                continue
-
-                except (subprocess.CalledProcessError, FileNotFoundError):
-                    # If compression fails, we still need to check if it's under the limit
-                    print("Warning: Could not compress image", file=sys.stderr)
-
-            # Final hard check - fail if still too large
-            if len(file_data) > max_raw_size:
-                print(f"Error: Image still too large after compression ({len(file_data):,} bytes raw, would be {int(len(file_data) * 1.33):,} bytes base64)", file=sys.stderr)
-                print(f"Maximum allowed: {max_raw_size:,} bytes raw (10MB base64 limit)", file=sys.stderr)
-                sys.exit(1)
-
-            base64_data = base64.b64encode(file_data).decode('utf-8')
-
-            # Double check base64 size
-            if len(base64_data) > 10_000_000:  # 10MB
-                print(f"Error: Base64 image size ({len(base64_data):,} bytes) exceeds 10MB limit", file=sys.stderr)
-                sys.exit(1)
-
-            image_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{base64_data}",
-                    "detail": "high"
-                }
-            })
-
-            # Clean up temporary file
-            os.unlink(actual_image_path)
-            page_num += 1
+                logger.info("PDF conversion completed, collecting generated images...")
+                image_content = [page_futures[page_num].result() for page_num in sorted(page_futures)]
 
         if not image_content:
-            raise Exception("No images were generated from PDF")
+            raise FileProcessingError("No images were generated from PDF")
 
-        print(f"Converted {len(image_content)} pages to images for analysis", file=sys.stderr)
+        logger.info(f"Converted {len(image_content)} pages to images for analysis")
 
         # Return first image for single image processing, or combine for multi-page
         if len(image_content) == 1:
@@ -460,25 +562,159 @@ def convert_pdf_to_images(file_path, max_pages=5):
                 "images": image_content
             }
 
-    except subprocess.TimeoutExpired:
-        print("Error: PDF conversion timed out. The PDF may be corrupted or extremely complex.", file=sys.stderr)
-        sys.exit(1)
+    except subprocess.TimeoutExpired as e:
+        raise FileProcessingError("PDF conversion timed out. The PDF may be corrupted or extremely complex.") from e
     except subprocess.CalledProcessError as e:
-        print(f"Error converting PDF to images: {e}", file=sys.stderr)
-        if e.stderr:
-            print(f"Error details: {e.stderr}", file=sys.stderr)
-        sys.exit(1)
+        details = f"\nError details: {e.stderr}" if e.stderr else ""
+        raise FileProcessingError(f"Could not convert PDF to images: {e}{details}") from e
+    except GrokError:
+        raise
     except Exception as e:
-        print(f"Unexpected error during PDF conversion: {e}", file=sys.stderr)
-        sys.exit(1)
+        raise FileProcessingError(f"Unexpected error during PDF conversion: {e}") from e
+
+
+def count_meaningful_chars(text: str, limit: int) -> int:
+    """Count printable, non-whitespace characters in text, stopping once limit is reached
+
+    Only whether the threshold is met matters, so a text PDF is decided after the
+    first few characters instead of scanning the whole extracted text.
+    """
+    count = 0
+    for c in text:
+        if c.isprintable() and not c.isspace():
+            count += 1
+            if count >= limit:
+                break
+    return count
+
+
+def file_content_digest(file_path: str) -> str:
+    """Return a hex digest of a file's contents
+
+    Uses BLAKE3 (SIMD and multithreaded) over a memory map when the blake3 package is
+    available, otherwise streams the file through hashlib's BLAKE2b. Digests are
+    remembered for the life of the process, keyed by inode, size and modification
+    time, so callers that each cache by content (like the invoice renamer and the
+    content cache here) only hash a file once.
+    """
+    with open(file_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with _digest_lock:
+            digest = _digests.get(key)
+        if digest is not None:
+            return digest
+        if blake3 is None:
+            digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+        elif st.st_size == 0:
+            digest = blake3.blake3().hexdigest(length=16)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest = blake3.blake3(mapped, max_threads=blake3.blake3.AUTO).hexdigest(length=16)
+    with _digest_lock:
+        _digests[key] = digest
+    return digest
+
+
+def get_content_cache_path(file_path: str, all_pages: bool) -> str:
+    """Return the cache file location for a file's extracted content
+
+    The key is derived from the file's bytes, so the entry survives the file being
+    renamed or moved (which is what the renamer does) and is invalidated by any edit,
+    even on filesystems where modification times are unreliable.
+    """
+    key = f"{file_content_digest(file_path)}-{'all' if all_pages else 'first'}"
+    return os.path.join(os.path.expanduser(CACHE_DIR), f"{key}.json")
+
+
+def read_json_file(path: str) -> Optional[Any]:
+    """Load a JSON file, or return None if it is missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path: str, data: Any):
+    """Write data to a JSON file, creating its directory if needed
+
+    The data goes to a private temp file that is then renamed over the target, so
+    readers never see a partial file.
+
+    Raises:
+        OSError: If the file could not be written
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def load_cached_content(cache_path: str) -> Optional[Dict[str, Any]]:
+    """Load previously extracted text from the cache, or None on a miss"""
+    content = read_json_file(cache_path)
+    if content is None:
+        return None
+    if not isinstance(content, dict) or content.get("type") != "text":
+        # Entry from an older version that cached page images; drop it
+        try:
+            os.unlink(cache_path)
+        except OSError:
+            pass
+        return None
+    return content
+
+
+def save_cached_content(cache_path: str, content: Dict[str, Any]):
+    """Store extracted content in the cache (failures only produce a warning)"""
+    try:
+        write_json_atomic(cache_path, content)
+    except OSError as e:
+        logger.warning(f"Could not write content cache: {e}")
 
 
 def read_file_content(file_path, all_pages=False):
-    """Read file content and return appropriate format for Grok API"""
+    """Read file content and return appropriate format for Grok API
+
+    Text extracted from PDFs is cached on disk, so re-processing an unchanged file
+    skips pdftotext. Rendered or encoded images are never cached: they are large
+    and would keep copies of the documents' pages around indefinitely.
+    """
     if not os.path.exists(file_path):
-        print(f"Error: File '{file_path}' not found", file=sys.stderr)
-        sys.exit(1)
+        raise FileProcessingError(f"File '{file_path}' not found")
 
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext != '.pdf':
+        # Only PDF text is cached; other files are read directly
+        return extract_file_content(file_path, all_pages=all_pages)
+
+    try:
+        cache_path = get_content_cache_path(file_path, all_pages)
+    except OSError:
+        # Unreadable file: skip the cache and let extract_file_content report it
+        cache_path = None
+    if cache_path:
+        cached_content = load_cached_content(cache_path)
+        if cached_content is not None:
+            logger.info("Using cached content from previous run")
+            return cached_content
+
+    content = extract_file_content(file_path, all_pages=all_pages)
+    if cache_path and content.get("type") == "text":
+        save_cached_content(cache_path, content)
+    return content
+
+
+def extract_file_content(file_path, all_pages=False):
+    """Extract file content in the format expected by the Grok API (uncached)"""
     mime_type, _ = mimetypes.guess_type(file_path)
     file_ext = os.path.splitext(file_path)[1].lower()
 
@@ -487,43 +723,31 @@ def read_file_content(file_path, all_pages=False):
         if file_ext == '.pdf':
             try:
                 # First try text extraction
-                # Try to find pdftotext in common locations
-                pdftotext_paths = ['/opt/homebrew/bin/pdftotext', '/usr/bin/pdftotext', '/usr/local/bin/pdftotext']
-                pdftotext_cmd = None
-                for path in pdftotext_paths:
-                    if os.path.exists(path):
-                        pdftotext_cmd = path
-                        break
-
+                pdftotext_cmd = find_poppler_binary('pdftotext')
                 if not pdftotext_cmd:
-                    # Try to find it in PATH
-                    try:
-                        which_result = subprocess.run(['which', 'pdftotext'], capture_output=True, text=True, check=True)
-                        pdftotext_cmd = which_result.stdout.strip()
-                    except subprocess.CalledProcessError:
-                        raise Exception("pdftotext not found. Please install poppler-utils.")
+                    raise FileProcessingError("pdftotext not found. Please install poppler-utils.")
 
                 result = subprocess.run([pdftotext_cmd, file_path, '-'],
                                         capture_output=True, text=True, check=True)
                 text_content = result.stdout.strip()
 
                 # Check if meaningful text was extracted (more than just whitespace/control chars)
-                meaningful_text = ''.join(c for c in text_content if c.isprintable() and not c.isspace())
+                meaningful_chars = count_meaningful_chars(text_content, MIN_MEANINGFUL_TEXT)
 
-                if len(meaningful_text) < 10:  # Less than 10 printable characters suggests scanned PDF
-                    print(f"PDF appears to be scanned (minimal text extracted: {len(meaningful_text)} chars). Trying image extraction first...", file=sys.stderr)
+                if meaningful_chars < MIN_MEANINGFUL_TEXT:  # Few printable characters suggests scanned PDF
+                    logger.info(f"PDF appears to be scanned (minimal text extracted: {meaningful_chars} chars). Trying image extraction first...")
                     # Try extracting embedded images first (faster for PDFs with embedded images)
                     extracted_image = extract_embedded_images(file_path, all_pages=all_pages)
                     if extracted_image:
                         return extracted_image
-                    print("No embedded images found. Converting to images for vision analysis...", file=sys.stderr)
+                    logger.info("No embedded images found. Converting to images for vision analysis...")
                     max_pages = None if all_pages else 1
                     return convert_pdf_to_images(file_path, max_pages=max_pages)
                 else:
                     return {"type": "text", "content": text_content}
 
             except subprocess.CalledProcessError as e:
-                print(f"Text extraction failed: {e}. Trying image extraction first, then conversion...", file=sys.stderr)
+                logger.warning(f"Text extraction failed: {e}. Trying image extraction first, then conversion...")
                 # Try extracting embedded images first (faster for PDFs with embedded images)
                 extracted_image = extract_embedded_images(file_path, all_pages=all_pages)
                 if extracted_image:
@@ -532,7 +756,7 @@ def read_file_content(file_path, all_pages=False):
                 return convert_pdf_to_images(file_path, max_pages=max_pages)
 
         # Handle image files
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif']:
+        elif file_ext in IMAGE_EXTENSIONS:
             return process_image_file(file_path, mime_type)
 
         # For other files, try to read as text first
@@ -543,43 +767,195 @@ def read_file_content(file_path, all_pages=False):
         except UnicodeDecodeError:
             # If text reading fails, treat as binary (images)
             return process_image_file(file_path, mime_type)
+    except GrokError:
+        raise
     except Exception as e:
-        print(f"Error reading file '{file_path}': {e}", file=sys.stderr)
-        sys.exit(1)
+        raise FileProcessingError(f"Could not read file '{file_path}': {e}") from e
 
 
-def load_env_file():
-    """Load environment variables from ~/.env file"""
-    env_file = os.path.expanduser("~/.env")
+def load_env_file(only: Optional[Set[str]] = None):
+    """Load environment variables from ~/.env file
+
+    Args:
+        only: Optional set of variable names that are needed; parsing stops
+              as soon as all of them are set
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+
+    env_file = os.path.expanduser(ENV_FILE_PATH)
     if os.path.exists(env_file):
         try:
             with open(env_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        # Handle both "export KEY=value" and "KEY=value" formats
-                        if line.startswith('export '):
-                            line = line[7:]  # Remove 'export ' prefix
-
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip().strip('"\'')  # Remove quotes
-                        if key and not os.getenv(key):  # Only set if not already in environment
-                            os.environ[key] = value
+                data = f.read()
+            # Handles both "export KEY=value" and "KEY=value" formats
+            for match in ENV_LINE_PATTERN.finditer(data):
+                key, value = match.groups()
+                value = value.strip().strip('"\'')  # Remove quotes
+                if not os.getenv(key):  # Only set if not already in environment
+                    os.environ[key] = value
+                if only and all(os.getenv(name) for name in only):
+                    # Everything requested is available, the rest of the file isn't needed yet
+                    return
         except Exception as e:
-            print(f"Warning: Could not read ~/.env file: {e}", file=sys.stderr)
+            logger.warning(f"Could not read ~/.env file: {e}")
+
+    _env_loaded = True
+
+
+def encode_json(data: Dict[str, Any]) -> bytes:
+    """Serialize a request body to compact UTF-8 JSON
+
+    orjson writes bytes directly and scans the large base64 image strings much
+    faster; the standard library path drops the default separator whitespace.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def stream_json_body(data: Dict[str, Any]) -> Tuple[Iterator[bytes], int]:
+    """Serialize a request body as a stream of chunks with a known total length
+
+    The message skeleton is serialized with a placeholder in place of each image data
+    URL, and the URLs (already plain ASCII with nothing to escape) are spliced back in
+    while sending, so the full multi-megabyte JSON document is never built in memory
+    and each URL is only ever converted to bytes in BODY_CHUNK_SIZE slices.
+
+    Returns:
+        Tuple of (iterator over body chunks, total body length in bytes)
+    """
+    placeholder = f"@@image-{secrets.token_hex(16)}@@"
+    image_urls = []
+    skeleton_messages = []
+    for message in data["messages"]:
+        content = message["content"]
+        if isinstance(content, list):
+            skeleton_content = []
+            for item in content:
+                if item.get("type") == "image_url":
+                    image_urls.append(item["image_url"]["url"])
+                    item = {**item, "image_url": {**item["image_url"], "url": placeholder}}
+                skeleton_content.append(item)
+            message = {**message, "content": skeleton_content}
+        skeleton_messages.append(message)
+
+    skeleton = encode_json({**data, "messages": skeleton_messages})
+    pieces = skeleton.split(placeholder.encode('ascii'))
+    content_length = sum(len(piece) for piece in pieces) + sum(len(url) for url in image_urls)
+
+    def chunks():
+        yield pieces[0]
+        for url, piece in zip(image_urls, pieces[1:]):
+            # Encode the data URL a slice at a time so no full-size bytes copy is made
+            for start in range(0, len(url), BODY_CHUNK_SIZE):
+                yield url[start:start + BODY_CHUNK_SIZE].encode('ascii')
+            yield piece
+
+    return chunks(), content_length
+
+
+def get_api_connection(url: str) -> http.client.HTTPSConnection:
+    """Return this thread's keep-alive connection to the API host, creating it on first use
+
+    Reusing one connection for every request in the thread avoids a new TCP and TLS
+    handshake per file. An HTTPS proxy from the environment is honored via CONNECT.
+    """
+    connection = getattr(_api_local, 'connection', None)
+    if connection is None:
+        host = urllib.parse.urlsplit(url).netloc
+        proxy = urllib.request.getproxies().get('https')
+        if proxy and not urllib.request.proxy_bypass(host):
+            connection = http.client.HTTPSConnection(urllib.parse.urlsplit(proxy).netloc, timeout=API_TIMEOUT)
+            connection.set_tunnel(host)
+        else:
+            connection = http.client.HTTPSConnection(host, timeout=API_TIMEOUT)
+        _api_local.connection = connection
+        with _api_connections_lock:
+            _api_connections.add(connection)
+    return connection
+
+
+def close_api_connection():
+    """Close this thread's API connection (it is re-created on next use)"""
+    connection = getattr(_api_local, 'connection', None)
+    if connection is not None:
+        connection.close()
+        _api_local.connection = None
+        with _api_connections_lock:
+            _api_connections.discard(connection)
+
+
+def close_all_api_connections():
+    """Close the API connections opened by every thread"""
+    with _api_connections_lock:
+        for connection in _api_connections:
+            connection.close()
+        _api_connections.clear()
+
+
+atexit.register(close_all_api_connections)
+
+
+def post_api_request(url: str, data: Dict[str, Any], headers: Dict[str, str]) -> Tuple[int, str, bytes]:
+    """POST a JSON request body over this thread's keep-alive connection
+
+    If the server has already dropped an idle keep-alive connection, so sending the
+    request fails, it is retried once on a fresh one. Failures after the request was
+    sent are never retried: the server may already be processing (and billing) it.
+
+    Returns:
+        Tuple of (HTTP status, reason phrase, response body)
+    """
+    path = urllib.parse.urlsplit(url).path
+    for attempt in range(2):
+        connection = get_api_connection(url)
+        reused = connection.sock is not None
+        if reused and select.select([connection.sock], [], [], 0)[0]:
+            # An idle connection only becomes readable when the server has closed it
+            close_api_connection()
+            connection = get_api_connection(url)
+            reused = False
+        body_chunks, content_length = stream_json_body(data)
+        try:
+            connection.request('POST', path, body=body_chunks,
+                               headers={**headers, "Content-Length": str(content_length)})
+        except (ConnectionResetError, BrokenPipeError):
+            close_api_connection()
+            if not reused or attempt:
+                raise
+            continue
+        except BaseException:
+            close_api_connection()
+            raise
+        try:
+            response = connection.getresponse()
+            response_data = response.read()
+            if response.will_close:
+                close_api_connection()
+            return response.status, response.reason, response_data
+        except BaseException:
+            close_api_connection()
+            raise
 
 
 def call_grok_api(prompt, model="grok-4-fast-reasoning", file_path=None, all_pages=False, auto_vision=True):
+    """Send a prompt (and optionally a file) to the Grok API and return the response text
+
+    Raises:
+        FileProcessingError: If the file could not be read or converted
+        APIError: If the API request fails or returns an unexpected response
+        GrokError: If no API key is configured
+    """
     api_key = os.getenv("GROK_API_KEY")
     if not api_key:
         # Try loading from ~/.env file
-        load_env_file()
+        load_env_file(only={"GROK_API_KEY"})
         api_key = os.getenv("GROK_API_KEY")
 
     if not api_key:
-        print("Error: GROK_API_KEY not found in environment or ~/.env file", file=sys.stderr)
-        sys.exit(1)
+        raise GrokError("GROK_API_KEY not found in environment or ~/.env file")
 
     url = "https://api.x.ai/v1/chat/completions"
     headers = {
@@ -604,7 +980,7 @@ def call_grok_api(prompt, model="grok-4-fast-reasoning", file_path=None, all_pag
         else:
             # For binary files (images), use multimodal format with vision model
             if auto_vision and model == "grok-4-fast-reasoning":
-                print("Switching to vision model for image analysis...", file=sys.stderr)
+                logger.info("Switching to vision model for image analysis...")
                 model = "grok-2-vision-1212"
 
             # Handle multi-image content (from multi-page PDFs)
@@ -637,27 +1013,33 @@ def call_grok_api(prompt, model="grok-4-fast-reasoning", file_path=None, all_pag
         }
 
     try:
-        json_data = json.dumps(data).encode('utf-8')
+        status, reason, response_data = post_api_request(url, data, headers)
 
-        req = urllib.request.Request(url, data=json_data, headers=headers, method='POST')
+        if status >= 400:
+            error_body = response_data.decode('utf-8', errors='replace')
+            details = f"\nResponse body: {error_body}" if error_body else ""
+            raise APIError(f"HTTP Error {status}: {reason}{details}")
 
-        with urllib.request.urlopen(req) as response:
-            response_data = response.read().decode('utf-8')
-            result = json.loads(response_data)
-            return result["choices"][0]["message"]["content"]
+        result = json.loads(response_data.decode('utf-8'))
+        content = result["choices"][0]["message"]["content"]
+        if not isinstance(content, str):
+            raise APIError(f"API response has no text content (got {type(content).__name__})")
+        return content
 
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode('utf-8') if e.fp else ''
-        print(f"HTTP Error {e.code}: {e.reason}", file=sys.stderr)
-        if error_body:
-            print(f"Response body: {error_body}", file=sys.stderr)
-        sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"Error making API request: {e}", file=sys.stderr)
-        sys.exit(1)
+    except (OSError, http.client.HTTPException) as e:
+        raise APIError(f"Could not make API request: {e}") from e
     except (KeyError, IndexError, json.JSONDecodeError) as e:
-        print(f"Error parsing API response: {e}", file=sys.stderr)
-        sys.exit(1)
+        raise APIError(f"Could not parse API response: {e}") from e
+
+
+class CLIFormatter(logging.Formatter):
+    """Print progress messages as-is and prefix warnings and errors with their level"""
+
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno > logging.INFO:
+            return f"{record.levelname.title()}: {message}"
+        return message
 
 
 def main():
@@ -671,7 +1053,15 @@ def main():
 
     args = parser.parse_args()
 
-    result = call_grok_api(args.prompt, args.model, args.file, args.all_pages)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(CLIFormatter())
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+    try:
+        result = call_grok_api(args.prompt, args.model, args.file, args.all_pages)
+    except GrokError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     print(result)
 
 
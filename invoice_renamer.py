@@ -2,13 +2,18 @@
 import os
 import sys
 import argparse
-import subprocess
+import errno
 import json
 import re
 from datetime import datetime
 import logging
+from logging.handlers import MemoryHandler, RotatingFileHandler
 import hashlib
 import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from grok import GrokError, call_grok_api as grok_call_api, file_content_digest, read_json_file, write_json_atomic
 
 try:
     from titlecase import titlecase  # type: ignore
@@ -17,80 +22,140 @@ except ImportError:
     def titlecase(text):
         return text.title()
 
+# Number of files analyzed concurrently when several are given
+DEFAULT_WORKERS = 4
+
+# Extracted invoice info is cached here, keyed by a hash of the file contents
+CACHE_DIR = '~/.cache/invoice_renamer'
+
+# Deletes the characters that are not allowed in filenames
+_DEL_TABLE = str.maketrans('', '', '<>:"/\\|?*')
+
+# Trailing articles/conjunctions/prepositions/common business terms dropped from names
+_TRAILING_WORDS = frozenset({
+    'and', 'or', 'of', 'the', 'a', 'an', 'for', 'to', 'in', 'at', 'by', 'with',
+    'company', 'inc', 'llc', 'ltd', 'corp', 'corporation',
+})
+
+# Precompiled patterns used for every file
+_NON_DIGIT = re.compile(r'[^\d]')
+_DATE_YMD = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})')
+
+# Date formats accepted by format_date, tried in order
+_DATE_FORMATS = (
+    "%Y-%m-%d",      # 2024-09-23
+    "%m/%d/%Y",      # 09/23/2024
+    "%m-%d-%Y",      # 09-23-2024
+    "%d/%m/%Y",      # 23/09/2024
+    "%Y/%m/%d",      # 2024/09/23
+    "%B %d, %Y",     # September 23, 2024
+    "%b %d, %Y",     # Sep 23, 2024
+    "%d %B %Y",      # 23 September 2024
+    "%d %b %Y",      # 23 Sep 2024
+)
+
 
 def setup_logging():
     """Setup logging to /tmp/invoice_renamer.log with rotation to keep file size manageable"""
     log_file = '/tmp/invoice_renamer.log'
 
-    # Check if log file exists and is too large (>100KB), truncate to last 50KB
-    if os.path.exists(log_file):
-        file_size = os.path.getsize(log_file)
-        max_size = 100 * 1024  # 100KB
-        if file_size > max_size:
-            # Read the last portion of the file
-            keep_size = 50 * 1024  # Keep last 50KB
-            with open(log_file, 'rb') as f:
-                f.seek(-keep_size, 2)  # Seek from end
-                data = f.read()
-                # Find first complete line
-                first_newline = data.find(b'\n')
-                if first_newline > 0:
-                    data = data[first_newline + 1:]
-
-            # Write truncated data back
-            with open(log_file, 'wb') as f:
-                f.write(b'=== LOG TRUNCATED TO PREVENT EXCESSIVE SIZE ===\n')
-                f.write(data)
-
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    # Roll over to invoice_renamer.log.1 once the log exceeds 100KB; the file isn't
+    # opened until the first batch of records is written
+    file_handler = RotatingFileHandler(log_file, maxBytes=100 * 1024, backupCount=1, delay=True)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                                datefmt='%Y-%m-%d %H:%M:%S'))
+    # Buffer records and write them in batches; errors are written immediately and
+    # logging.shutdown() flushes whatever is left when the process exits
+    buffered_handler = MemoryHandler(capacity=200, flushLevel=logging.ERROR, target=file_handler)
+
+    logging.basicConfig(handlers=[buffered_handler], level=logging.DEBUG)
     return logging.getLogger(__name__)
 
 
 def call_grok_api(prompt, file_path, all_pages=False):
-    """Call grok.py script to extract invoice information"""
+    """Call the Grok API in-process to extract invoice information"""
     logger = logging.getLogger(__name__)
     logger.info(f"Calling Grok API for file: {file_path}")
-    logger.debug(f"Prompt: {prompt[:200]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Prompt: %s...", prompt[:200])
 
     try:
-        cmd = [
-            os.path.expanduser('~/.pyenv/shims/python3'),
-            os.path.join(os.path.dirname(__file__), 'grok.py'),
-            prompt,
-            '--file', file_path
-        ]
-        if all_pages:
-            cmd.append('--all-pages')
-
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-
-        logger.debug(f"Grok API response: {result.stdout}")
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error calling Grok API: {e}")
-        if e.stderr:
-            logger.error(f"Error details: {e.stderr}")
-            # Check for specific error types and provide helpful messages
-            if "SSL: CERTIFICATE_VERIFY_FAILED" in e.stderr:
-                logger.warning("SSL certificate verification failed")
-            elif "exceeds our limit" in e.stderr and "bytes" in e.stderr:
-                logger.warning("Image file too large for processing")
-        raise  # Re-raise to let caller handle
-    except FileNotFoundError:
-        logger.error("grok.py script not found in the same directory")
+        result = grok_call_api(prompt, "grok-4-fast-reasoning", file_path, all_pages)
+
+        logger.debug("Grok API response: %s", result)
+        return result.strip()
+    except GrokError as e:
+        details = str(e)
+        logger.error(f"Error calling Grok API: {details}")
+        # Check for specific error types and provide helpful messages
+        if "SSL: CERTIFICATE_VERIFY_FAILED" in details:
+            logger.warning("SSL certificate verification failed")
+        elif "exceeds our limit" in details and "bytes" in details:
+            logger.warning("Image file too large for processing")
         raise  # Re-raise to let caller handle
 
 
+def get_info_cache_path(file_path, all_pages=False):
+    """Return the cache file for a file's extracted info, keyed by its content hash"""
+    digest = file_content_digest(file_path)
+    suffix = '-all-pages' if all_pages else ''
+    return os.path.join(os.path.expanduser(CACHE_DIR), f"{digest}{suffix}.json")
+
+
+def load_cached_info(cache_path):
+    """Load previously extracted info from the cache, or None on a miss"""
+    info = read_json_file(cache_path)
+    return info if isinstance(info, dict) and 'business_name' in info else None
+
+
+def save_cached_info(cache_path, info):
+    """Store extracted info in the cache (failures are only logged)"""
+    logger = logging.getLogger(__name__)
+    try:
+        write_json_atomic(cache_path, info)
+    except OSError as e:
+        logger.warning(f"Could not write info cache: {e}")
+
+
+def find_info_json(response):
+    """Return the first JSON object in the response that has a business_name key
+
+    Each '{' is tried as the start of an object and the decoder stops at its
+    matching brace, so surrounding prose and nested objects are handled.
+    """
+    decoder = json.JSONDecoder()
+    start = response.find('{')
+    while start >= 0:
+        try:
+            candidate, _ = decoder.raw_decode(response, start)
+        except json.JSONDecodeError:
+            candidate = None
+        if isinstance(candidate, dict) and 'business_name' in candidate:
+            return candidate
+        start = response.find('{', start + 1)
+    return None
+
+
 def extract_invoice_info(file_path, all_pages=False):
-    """Extract business name and date from invoice using Grok"""
+    """Extract business name and date from invoice using Grok
+
+    Successful results are cached by file content, so re-running on an unchanged
+    file skips the API call entirely.
+    """
     logger = logging.getLogger(__name__)
     logger.info(f"Extracting invoice info from: {file_path}")
 
+    try:
+        cache_path = get_info_cache_path(file_path, all_pages)
+    except OSError as e:
+        logger.warning(f"Could not hash file for info cache: {e}")
+        cache_path = None
+    if cache_path:
+        cached_info = load_cached_info(cache_path)
+        if cached_info is not None:
+            logger.info(f"Using cached info: {cached_info}")
+            return cached_info
+
     prompt = """Extract the following information from this document:
 1. Business name - Follow these priority rules:
    - Use the most recognizable ISSUING company/bank name
@@ -159,7 +224,7 @@ If you cannot find any piece of information, use null for that field."""
 
     try:
         response = call_grok_api(prompt, file_path, all_pages=all_pages)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+    except GrokError as e:
         logger.error(f"Failed to call Grok API: {e}")
         # Return fallback data instead of crashing
         return {
@@ -175,11 +240,8 @@ If you cannot find any piece of information, use null for that field."""
     # Try to extract JSON from the response
     try:
         # Look for JSON in the response
-        json_match = re.search(r'\{[^}]*"business_name"[^}]*\}', response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
-            parsed_info = json.loads(json_str)
-        else:
+        parsed_info = find_info_json(response)
+        if parsed_info is None:
             # Fallback: try to parse the entire response as JSON
             parsed_info = json.loads(response)
 
@@ -187,18 +249,20 @@ If you cannot find any piece of information, use null for that field."""
 
         # Log a warning if we have partial bank statement info (one field but not the other)
         # Exception: Portfolio statements don't need account_last_4
-        has_account_type = parsed_info.get('account_type') is not None
-        has_account_last_4 = parsed_info.get('account_last_4') is not None
-        account_type_value = parsed_info.get('account_type')
-        is_portfolio = account_type_value and account_type_value.lower() == 'portfolio'
-        if has_account_type != has_account_last_4 and not is_portfolio:
-            logger.warning(f"Partial bank statement data: account_type={parsed_info.get('account_type')}, account_last_4={parsed_info.get('account_last_4')}")
+        account_type = parsed_info.get('account_type')
+        account_last_4 = parsed_info.get('account_last_4')
+        is_portfolio = isinstance(account_type, str) and account_type.lower() == 'portfolio'
+        if (account_type is None) != (account_last_4 is None) and not is_portfolio:
+            logger.warning("Partial bank statement data: account_type=%s, account_last_4=%s", account_type, account_last_4)
 
         # Validate that document_type was provided
         if not parsed_info.get('document_type'):
             logger.warning("Document type not provided by API, defaulting to 'Document'")
             parsed_info['document_type'] = 'Document'
 
+        # Only cache real answers; error replies and other JSON must be retried next run
+        if cache_path and isinstance(parsed_info, dict) and 'business_name' in parsed_info:
+            save_cached_info(cache_path, parsed_info)
         return parsed_info
     except json.JSONDecodeError as e:
         logger.error(f"Could not parse Grok response as JSON: {e}")
@@ -223,15 +287,18 @@ def clean_filename(text, limit_words=None):
         return "Unknown"
 
     # Remove or replace problematic characters
-    cleaned = re.sub(r'[<>:"/\\|?*]', '', text)  # Remove illegal filename chars
-    cleaned = re.sub(r'\s+', ' ', cleaned)        # Normalize whitespace
-    cleaned = cleaned.strip()                     # Remove leading/trailing space
+    cleaned = text.translate(_DEL_TABLE)  # Remove illegal filename chars
+    cleaned = ' '.join(cleaned.split())   # Normalize whitespace and trim the ends
 
     # Convert to proper capitalization if text is mostly uppercase
     # Skip titlecase for short names (likely acronyms like USAA, IBM, etc.)
-    letter_chars = [c for c in cleaned if c.isalpha()]
-    if letter_chars and sum(1 for c in letter_chars if c.isupper()) > len(letter_chars) * 0.7:
-        if len(cleaned) >= 5:  # Only apply titlecase to names 5+ characters
+    if len(cleaned) >= 5:  # Only apply titlecase to names 5+ characters
+        letters = upper = 0
+        for c in cleaned:
+            if c.isalpha():
+                letters += 1
+                upper += c.isupper()
+        if letters and upper * 10 > letters * 7:  # More than 70% uppercase
             cleaned = titlecase(cleaned)
 
     # Limit to specified number of words if requested
@@ -241,9 +308,8 @@ def clean_filename(text, limit_words=None):
             cleaned = ' '.join(words[:limit_words])
 
         # Remove trailing articles/conjunctions/prepositions/common business terms
-        trailing_words = ['and', 'or', 'of', 'the', 'a', 'an', 'for', 'to', 'in', 'at', 'by', 'with', 'company', 'inc', 'llc', 'ltd', 'corp', 'corporation']
         words = cleaned.split()
-        while words and words[-1].lower() in trailing_words:
+        while words and words[-1].lower() in _TRAILING_WORDS:
             words.pop()
         if words:
             cleaned = ' '.join(words)
@@ -264,49 +330,89 @@ def format_date(date_str):
     if not date_str:
         return "00000000"
 
+    max_year = datetime.now().year + 10
+
+    # Fast path for YYYY-MM-DD, the format the prompt asks for
+    if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+        try:
+            date_obj = datetime.fromisoformat(date_str)
+            if 1900 <= date_obj.year <= max_year:
+                return date_obj.strftime("%Y%m%d")
+        except ValueError:
+            pass
+
     # Try different date formats
-    date_formats = [
-        "%Y-%m-%d",      # 2024-09-23
-        "%m/%d/%Y",      # 09/23/2024
-        "%m-%d-%Y",      # 09-23-2024
-        "%d/%m/%Y",      # 23/09/2024
-        "%Y/%m/%d",      # 2024/09/23
-        "%B %d, %Y",     # September 23, 2024
-        "%b %d, %Y",     # Sep 23, 2024
-        "%d %B %Y",      # 23 September 2024
-        "%d %b %Y",      # 23 Sep 2024
-    ]
-
-    for fmt in date_formats:
+    for fmt in _DATE_FORMATS:
         try:
             date_obj = datetime.strptime(date_str, fmt)
             # Validate that the date is reasonable (not in far future/past)
-            now = datetime.now()
-            if date_obj.year < 1900 or date_obj.year > now.year + 10:
+            if date_obj.year < 1900 or date_obj.year > max_year:
                 continue
             return date_obj.strftime("%Y%m%d")
         except ValueError:
             continue
 
     # If no format matches, try to extract YYYY-MM-DD pattern with validation
-    match = re.search(r'(\d{4})-?(\d{2})-?(\d{2})', date_str)
+    match = _DATE_YMD.search(date_str)
     if match:
-        try:
-            year, month, day = map(int, match.groups())
-            # Basic date validation
-            if 1 <= month <= 12 and 1 <= day <= 31 and 1900 <= year <= datetime.now().year + 10:
-                # Additional day validation for months with < 31 days
-                days_in_month = [31, 29 if (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
-                if day <= days_in_month:
-                    return f"{year:04d}{month:02d}{day:02d}"
-        except (ValueError, IndexError):
-            pass
+        year, month, day = map(int, match.groups())
+        if 1900 <= year <= max_year:
+            try:
+                # datetime rejects invalid months and days, including Feb 29 outside leap years
+                datetime(year, month, day)
+                return f"{year:04d}{month:02d}{day:02d}"
+            except ValueError:
+                pass
 
     return "00000000"
 
 
-def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
-    """Rename invoice file based on extracted information and optionally move to target directory"""
+def move_file(src, dst):
+    """Move a file, renaming in place when possible
+
+    On the same volume this is a single rename. Across volumes the data is copied
+    with shutil's kernel-assisted copy to a temporary name next to the destination
+    and then renamed into place, so an interrupted move never leaves a truncated
+    file under the final name.
+    """
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(dst) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copy2(src, temp_path)
+        os.replace(temp_path, dst)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    os.unlink(src)
+
+
+def is_case_insensitive_dir(directory, names):
+    """Return whether file names in a directory are matched case-insensitively
+
+    Probes the filesystem with a case-swapped variant of an existing entry. An empty
+    directory can't be probed, so the platform default is assumed (case-insensitive
+    on macOS, case-sensitive elsewhere).
+    """
+    for name in names:
+        probe = name.swapcase()
+        if probe != name and probe not in names:
+            return os.path.exists(os.path.join(directory, probe))
+    return sys.platform == 'darwin'
+
+
+def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False, info=None):
+    """Rename invoice file based on extracted information and optionally move to target directory
+
+    If info is given it is used instead of calling extract_invoice_info, which lets
+    callers analyze several files concurrently and apply the renames afterwards.
+    """
     logger = logging.getLogger(__name__)
     logger.info(f"Starting rename process for: {file_path}")
 
@@ -315,10 +421,11 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
         print(f"Error: File '{file_path}' not found", file=sys.stderr)
         return False
 
-    logger.debug(f"Processing: {file_path}")
+    logger.debug("Processing: %s", file_path)
 
     # Extract information from invoice
-    info = extract_invoice_info(file_path, all_pages=all_pages)
+    if info is None:
+        info = extract_invoice_info(file_path, all_pages=all_pages)
 
     business_name = clean_filename(info.get('business_name'), limit_words=4)
     document_type = clean_filename(info.get('document_type')) if info.get('document_type') else 'Document'
@@ -326,12 +433,9 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
     invoice_number = info.get('invoice_number')
     if invoice_number:
         # If invoice_number looks like an account number (long digits), take last 4 digits
-        invoice_number_cleaned = re.sub(r'[^\d]', '', invoice_number)  # Keep only digits
-        if len(invoice_number_cleaned) >= 4:
-            invoice_number = invoice_number_cleaned[-4:]  # Take last 4 digits
-        else:
-            invoice_number = invoice_number_cleaned
-        invoice_number = clean_filename(invoice_number) if invoice_number else None
+        invoice_number_cleaned = _NON_DIGIT.sub('', invoice_number)  # Keep only digits
+        # Digits are already filename-safe, so clean_filename isn't needed
+        invoice_number = invoice_number_cleaned[-4:] or None  # Take last 4 digits (or fewer)
     else:
         invoice_number = None
     patient_animal_name = clean_filename(info.get('patient_animal_name')) if info.get('patient_animal_name') else None
@@ -339,12 +443,9 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
     account_last_4 = info.get('account_last_4')
     if account_last_4:
         # Ensure only the last 4 digits are used
-        account_last_4_cleaned = re.sub(r'[^\d]', '', account_last_4)  # Keep only digits
-        if len(account_last_4_cleaned) >= 4:
-            account_last_4 = account_last_4_cleaned[-4:]  # Take last 4 digits
-        else:
-            account_last_4 = account_last_4_cleaned  # If fewer than 4, use as-is
-        account_last_4 = clean_filename(account_last_4) if account_last_4 else None
+        account_last_4_cleaned = _NON_DIGIT.sub('', account_last_4)  # Keep only digits
+        # Digits are already filename-safe, so clean_filename isn't needed
+        account_last_4 = account_last_4_cleaned[-4:] or None  # Take last 4 digits (or fewer)
     else:
         account_last_4 = None
 
@@ -360,9 +461,10 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
     if account_last_4:
         logger.info(f"Extracted account last 4: {account_last_4}")
 
-    # Get file extension
-    file_dir = os.path.dirname(file_path)
-    file_ext = os.path.splitext(file_path)[1]
+    # Split the source path once; these are reused for the rest of the rename
+    file_dir, src_base = os.path.split(file_path)
+    file_ext = os.path.splitext(src_base)[1]
+    src_abs = os.path.abspath(file_path)
 
     # Create new filename with document type, patient/animal name and invoice number if available
     # Format: Business Name [Account-Type] Document-Type [Last4] [- Patient/Animal] [Invoice#] Date
@@ -393,6 +495,7 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
 
     # Determine target directory
     target_dir = move_to if move_to else file_dir
+    target_dir_name = os.path.basename(target_dir)
     if move_to and not os.path.exists(move_to):
         if dry_run:
             logger.info(f"Target directory does not exist (would be created): {move_to}")
@@ -400,34 +503,47 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
             os.makedirs(move_to, exist_ok=True)
             logger.info(f"Created target directory: {move_to}")
 
-    # Check if target file exists and make name unique if needed
-    base_new_file_path = os.path.join(target_dir, new_filename)
-    new_file_path = base_new_file_path
+    # Extract parts to insert counter before date
+    base_name = os.path.splitext(new_filename)[0]
 
-    # If target exists and it's not the same file, add numeric suffix before date
-    counter = 2
-    while os.path.exists(new_file_path) and os.path.abspath(new_file_path) != os.path.abspath(file_path):
-        # Extract parts to insert counter before date
-        base_name = os.path.splitext(new_filename)[0]
+    # If there's a valid date in the original filename construction, it should be at the end
+    # Check if the filename was constructed with a date originally
+    original_had_date = invoice_date and invoice_date != "00000000"
 
-        # If there's a valid date in the original filename construction, it should be at the end
-        # Check if the filename was constructed with a date originally
-        original_had_date = invoice_date and invoice_date != "00000000"
+    # Snapshot the target directory once rather than stat'ing every candidate name
+    try:
+        with os.scandir(target_dir or '.') as entries:
+            dir_names = {entry.name for entry in entries}
+    except FileNotFoundError:
+        dir_names = set()  # Target directory will be created
+
+    # Compare names the way the target filesystem resolves them
+    case_insensitive = is_case_insensitive_dir(target_dir or '.', dir_names)
+
+    def name_key(name):
+        return name.lower() if case_insensitive else name
+
+    # The file itself doesn't block its own name (e.g. a case-only rename)
+    own_name = src_base if os.path.abspath(target_dir or '.') == os.path.dirname(src_abs) else None
+    existing_names = {name_key(name) for name in dir_names if name != own_name}
 
+    # If target exists and it's not the same file, add numeric suffix before date
+    candidate_filename = new_filename
+    counter = 2
+    while name_key(candidate_filename) in existing_names:
         if original_had_date and base_name.endswith(invoice_date):
             # Remove the date from the end
             name_without_date = base_name[:-len(invoice_date)].rstrip()
             # Add counter and date back
-            unique_filename = f"{name_without_date} {counter} {invoice_date}{file_ext}"
+            candidate_filename = f"{name_without_date} {counter} {invoice_date}{file_ext}"
         elif original_had_date:
             # Original construction had date, but it's not at the end for some reason
             # Add counter before what should be the date position
-            unique_filename = f"{base_name} {counter}{file_ext}"
+            candidate_filename = f"{base_name} {counter}{file_ext}"
         else:
             # No date at end, just append counter at the end
-            unique_filename = f"{base_name} {counter}{file_ext}"
+            candidate_filename = f"{base_name} {counter}{file_ext}"
 
-        new_file_path = os.path.join(target_dir, unique_filename)
         counter += 1
 
         # Safety check to avoid infinite loop
@@ -436,22 +552,36 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
             print("Error: Too many files with similar names exist", file=sys.stderr)
             return False
 
-    new_filename = os.path.basename(new_file_path)
+    new_filename = candidate_filename
+    new_file_path = os.path.join(target_dir, new_filename)
     logger.info(f"New filename: {new_filename}")
 
     if dry_run:
         logger.info("Dry run mode - file not actually renamed")
         if move_to:
-            print(f"Would rename {os.path.basename(file_path)} to {new_filename} and move to {os.path.basename(target_dir)}")
+            print(f"Would rename {src_base} to {new_filename} and move to {target_dir_name}")
         else:
-            print(f"Would rename {os.path.basename(file_path)} to {new_filename}")
+            print(f"Would rename {src_base} to {new_filename}")
         return True
 
+    # Claim the new name with a hard link first: unlike a rename it fails instead of
+    # replacing a file that already exists, so no separate existence check is needed
+    linked = False
+    try:
+        os.link(file_path, new_file_path)
+        linked = True
+        target_exists = False
+    except FileExistsError:
+        target_exists = True
+    except OSError:
+        # No hard link support on this filesystem, or the target is on another volume
+        target_exists = os.path.exists(new_file_path)
+
     # Check if target file already exists
-    if os.path.exists(new_file_path):
+    if target_exists:
         # Do case-sensitive filename comparison
-        current_filename = os.path.basename(file_path)
-        target_filename = os.path.basename(new_file_path)
+        current_filename = src_base
+        target_filename = new_filename
 
         if current_filename == target_filename:
             logger.info("File already has the correct name")
@@ -459,10 +589,10 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
                 # File has correct name but needs to be moved
                 try:
                     if not dry_run:
-                        shutil.move(file_path, new_file_path)
-                        print(f"Moved {target_filename} to {os.path.basename(target_dir)}")
+                        move_file(file_path, new_file_path)
+                        print(f"Moved {target_filename} to {target_dir_name}")
                     else:
-                        print(f"Would move {target_filename} to {os.path.basename(target_dir)}")
+                        print(f"Would move {target_filename} to {target_dir_name}")
                     return True
                 except OSError as e:
                     logger.error(f"Error moving file: {e}")
@@ -478,13 +608,12 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
             try:
                 # Create unique temporary name based on original filename and timestamp
                 file_base = os.path.splitext(file_path)[0]
-                file_ext = os.path.splitext(file_path)[1]
 
                 # Create a hash from the original and target paths for uniqueness
-                unique_hash = hashlib.md5(f"{file_path}->{new_file_path}".encode()).hexdigest()[:8]
+                unique_hash = hashlib.blake2b(f"{file_path}->{new_file_path}".encode(), digest_size=4).hexdigest()
                 temp_path = f"{file_base}.tmp_{unique_hash}{file_ext}"
 
-                logger.debug(f"Using temporary path: {temp_path}")
+                logger.debug("Using temporary path: %s", temp_path)
 
                 # Step 1: Rename to temporary name
                 os.rename(file_path, temp_path)
@@ -492,7 +621,7 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
                 os.rename(temp_path, new_file_path)
                 logger.info(f"Successfully case-renamed: {file_path} -> {new_file_path}")
                 if move_to:
-                    print(f"Renamed {current_filename} to {target_filename} and moved to {os.path.basename(target_dir)}")
+                    print(f"Renamed {current_filename} to {target_filename} and moved to {target_dir_name}")
                 else:
                     print(f"Renamed {current_filename} to {target_filename}")
                 return True
@@ -507,38 +636,82 @@ def rename_invoice(file_path, dry_run=False, move_to=None, all_pages=False):
 
     # Rename/move the file
     try:
+        if linked:
+            # The new name is already in place, drop the old one
+            os.unlink(file_path)
+        elif move_to:
+            # Target directory may be on another volume
+            move_file(file_path, new_file_path)
+        else:
+            os.rename(file_path, new_file_path)
         if move_to:
-            # Use shutil.move for cross-directory moves
-            shutil.move(file_path, new_file_path)
             logger.info(f"Successfully moved and renamed: {file_path} -> {new_file_path}")
-            print(f"Renamed {os.path.basename(file_path)} to {os.path.basename(new_file_path)} and moved to {os.path.basename(target_dir)}")
+            print(f"Renamed {src_base} to {new_filename} and moved to {target_dir_name}")
         else:
-            os.rename(file_path, new_file_path)
             logger.info(f"Successfully renamed: {file_path} -> {new_file_path}")
-            print(f"Renamed {os.path.basename(file_path)} to {os.path.basename(new_file_path)}")
+            print(f"Renamed {src_base} to {new_filename}")
         return True
     except OSError as e:
+        if linked:
+            # Leave the file under its original name only
+            try:
+                os.unlink(new_file_path)
+            except OSError:
+                pass
         logger.error(f"Error renaming/moving file: {e}")
         print(f"Error renaming/moving file: {e}", file=sys.stderr)
         return False
 
 
-def main():
-    # Setup logging first
-    logger = setup_logging()
-    logger.info("=== Invoice Renamer Started ===")
-
+def build_parser():
+    """Build the command-line argument parser"""
     parser = argparse.ArgumentParser(description="Rename invoice files based on business name and date")
-    parser.add_argument("file", help="Invoice file to rename")
+    parser.add_argument("file", nargs='+', help="Invoice file(s) to rename")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be done without actually renaming")
     parser.add_argument("--move-to", help="Target directory to move the renamed file to")
     parser.add_argument("--all-pages", action="store_true", help="Process all pages of PDF (default: first page only)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of files to analyze concurrently (default: {DEFAULT_WORKERS})")
+    return parser
+
+
+def main():
+    # Setup logging first
+    logger = setup_logging()
+    logger.info("=== Invoice Renamer Started ===")
 
     try:
-        args = parser.parse_args()
-        logger.info(f"Arguments: file={args.file}, dry_run={args.dry_run}, move_to={args.move_to}, all_pages={args.all_pages}")
+        args = build_parser().parse_args()
+        logger.info(f"Arguments: file={args.file}, dry_run={args.dry_run}, move_to={args.move_to}, "
+                    f"all_pages={args.all_pages}, workers={args.workers}")
 
-        success = rename_invoice(args.file, args.dry_run, args.move_to, args.all_pages)
+        if len(args.file) == 1:
+            success = rename_invoice(args.file[0], args.dry_run, args.move_to, args.all_pages)
+        else:
+            # The API calls dominate, so analyze files concurrently but apply the
+            # renames one at a time, in the order given, to keep name conflict
+            # resolution deterministic. A failure on one file doesn't stop the others.
+            def analyze(file_path):
+                if not os.path.exists(file_path):
+                    return None, None  # rename_invoice reports the missing file
+                try:
+                    return extract_invoice_info(file_path, all_pages=args.all_pages), None
+                except Exception as e:
+                    return None, e
+
+            success = True
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+                for file_path, (info, error) in zip(args.file, executor.map(analyze, args.file)):
+                    if error is None:
+                        try:
+                            if rename_invoice(file_path, args.dry_run, args.move_to, args.all_pages, info=info):
+                                continue
+                        except Exception as e:
+                            error = e
+                    if error is not None:
+                        logger.error(f"Failed to process {file_path}: {error}")
+                        print(f"Error processing '{file_path}': {error}", file=sys.stderr)
+                    success = False
         logger.info(f"=== Invoice Renamer Finished - Success: {success} ===")
 
         # Only exit with error code if it's a critical failure, not just processing errors